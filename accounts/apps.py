@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class AccountsConfig(AppConfig):
     name = 'accounts'
+
+    def ready(self):
+        from django.contrib.auth.password_validation import get_default_password_validators
+
+        # The validators are cached by Django, but built lazily: load them (and the common passwords
+        # list behind CommonPasswordValidator) at startup instead of during the first sign up.
+        get_default_password_validators()
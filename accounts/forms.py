@@ -6,31 +6,91 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.functions import Lower
 from django.utils.translation import gettext_lazy as _
 
+from .models import Activation
 
-class UserCacheMixin:
-    user_cache = None
+ERR_WRONG_PASSWORD = _('Yanlış şifre girişi yaptınız.')
+ERR_NO_USER = _('Böyle bir kullanıcı bulunmamaktadır.')
+ERR_NO_USER_WITH_EMAIL = _('Bu eposta üzerine kayıtlı bir kullanıcı bulunmamaktadır.')
+ERR_NO_USER_WITH_EMAIL_OR_USERNAME = _('Bu eposta veya kullanıcı adı üzerine kayıtlı bir hesap bulunmamaktadır.')
+ERR_INACTIVE = _('Bu hesap henüz aktif değil.')
+ERR_ALREADY_ACTIVE = _('Bu hesap halihazırda aktif hale getirilmiş.')
+ERR_NO_ACTIVATION = _('Aktivasyon kodu bulunamadı.')
+ERR_ACTIVATION_ALREADY_SENT = _('Aktivasyon kodunuz halihazırda gönderilmiştir. 24 saat içerisinde sadece bir adet kod talebinde bulunabilirsiniz.')
+ERR_SAME_EMAIL = _('Lütfen başka bir eposta adresi giriniz.')
+ERR_EMAIL_TAKEN = _('Bu eposta adresini kullanamazsınız.')
 
+# The user columns each form and its view actually touch
+SIGN_IN_USER_FIELDS = ('id', 'is_active', 'password')
+RESEND_ACTIVATION_USER_FIELDS = ('id', 'is_active', 'email')
+RESTORE_PASSWORD_USER_FIELDS = ('id', 'is_active', 'password', 'last_login', 'email')
+REMIND_USERNAME_USER_FIELDS = ('id', 'is_active', 'email', 'username')
 
-class SignIn(UserCacheMixin, forms.Form):
-    password = forms.CharField(label=_('Şifre'), strip=False, widget=forms.PasswordInput)
 
+def _lookup_user(users, **lookup):
+    try:
+        return users.get(**lookup)
+    except User.DoesNotExist:
+        return None
+
+
+def _lookup_user_by_email(users, email):
+    # Compare on LOWER(email), so the lookup can use the auth_user_lower_email_idx index. The input is
+    # lowercased by the database as well, since its LOWER() may differ from str.lower() (SQLite only folds ASCII).
+    return _lookup_user(users.annotate(email_lower=Lower('email')), email_lower=Lower(Value(email)))
+
+
+def _lookup_user_by_login(users, email_or_username):
+    # Usernames may contain "@" too, so fall back to them when no email matches
+    user = None
+    if '@' in email_or_username:
+        user = _lookup_user_by_email(users, email_or_username)
+    if not user:
+        user = _lookup_user(users, username=email_or_username)
+
+    return user
+
+
+def _users_with_activation_state():
+    now_with_shift = timezone.now() - timedelta(hours=24)
+    activations = Activation.objects.filter(user=OuterRef('pk'))
+
+    return User.objects.only(*RESEND_ACTIVATION_USER_FIELDS).annotate(
+        has_activation=Exists(activations),
+        has_recent_activation=Exists(activations.filter(created_at__gt=now_with_shift)),
+    )
+
+
+class UserCacheMixin:
     def __init__(self, *args, **kwargs):
+        self.user_cache = None
         super().__init__(*args, **kwargs)
 
-        if settings.USE_REMEMBER_ME:
-            self.fields['remember_me'] = forms.BooleanField(label=_('Beni hatırla'), required=False)
+    def full_clean(self):
+        # Forget the user found by a previous clean, so it can't outlive a lookup that fails this time
+        self.user_cache = None
+        super().full_clean()
+
+
+class SignIn(UserCacheMixin, forms.Form):
+    password = forms.CharField(label=_('Şifre'), strip=False, widget=forms.PasswordInput)
+
+    if settings.USE_REMEMBER_ME:
+        remember_me = forms.BooleanField(label=_('Beni hatırla'), required=False)
 
     def clean_password(self):
         password = self.cleaned_data['password']
 
+        # Checking the password is deliberately slow. user_cache is only set once the account has passed its
+        # lookup and is_active checks in the current clean, so unknown and inactive accounts never reach it.
         if not self.user_cache:
             return password
 
         if not self.user_cache.check_password(password):
-            raise ValidationError(_('Yanlış şifre girişi yaptınız.'))
+            raise ValidationError(ERR_WRONG_PASSWORD)
 
         return password
 
@@ -38,21 +98,18 @@ class SignIn(UserCacheMixin, forms.Form):
 class SignInViaUsernameForm(SignIn):
     username = forms.CharField(label=_('Kullanıcı adı'))
 
-    @property
-    def field_order(self):
-        if settings.USE_REMEMBER_ME:
-            return ['username', 'password', 'remember_me']
-        return ['username', 'password']
+    # Django skips the names that aren't declared, so "remember_me" is harmless when it's disabled
+    field_order = ['username', 'password', 'remember_me']
 
     def clean_username(self):
         username = self.cleaned_data['username']
 
-        user = User.objects.filter(username=username).first()
+        user = _lookup_user(User.objects.only(*SIGN_IN_USER_FIELDS), username=username)
         if not user:
-            raise ValidationError(_('Böyle bir kullanıcı bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -62,21 +119,17 @@ class SignInViaUsernameForm(SignIn):
 class SignInViaEmailForm(SignIn):
     email = forms.EmailField(label=_('Eposta'))
 
-    @property
-    def field_order(self):
-        if settings.USE_REMEMBER_ME:
-            return ['email', 'password', 'remember_me']
-        return ['email', 'password']
+    field_order = ['email', 'password', 'remember_me']
 
     def clean_email(self):
         email = self.cleaned_data['email']
 
-        user = User.objects.filter(email__iexact=email).first()
+        user = _lookup_user_by_email(User.objects.only(*SIGN_IN_USER_FIELDS), email)
         if not user:
-            raise ValidationError(_('Bu eposta üzerine kayıtlı bir kullanıcı bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -86,21 +139,17 @@ class SignInViaEmailForm(SignIn):
 class SignInViaEmailOrUsernameForm(SignIn):
     email_or_username = forms.CharField(label=_('Eposta veya kullanıcı'))
 
-    @property
-    def field_order(self):
-        if settings.USE_REMEMBER_ME:
-            return ['email_or_username', 'password', 'remember_me']
-        return ['email_or_username', 'password']
+    field_order = ['email_or_username', 'password', 'remember_me']
 
     def clean_email_or_username(self):
         email_or_username = self.cleaned_data['email_or_username']
 
-        user = User.objects.filter(Q(username=email_or_username) | Q(email__iexact=email_or_username)).first()
+        user = _lookup_user_by_login(User.objects.only(*SIGN_IN_USER_FIELDS), email_or_username)
         if not user:
-            raise ValidationError(_('Bu eposta veya kullanıcı adı üzerine kayıtlı bir hesap bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL_OR_USERNAME)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -118,15 +167,7 @@ class SignUpForm(UserCreationForm):
     class Meta:
         model = User
         fields = settings.SIGN_UP_FIELDS
-     
-    def clean_email(self):
-        email = self.cleaned_data['email']
 
-        user = User.objects.filter(email__iexact=email).exists()
-        if user:
-            raise ValidationError(_('Bu eposta adresini kullanamazsınız.'))
-
-        return email
 
 class ResendActivationCodeForm(UserCacheMixin, forms.Form):
     email_or_username = forms.CharField(label=_('Eposta veya kullanıcı adı'))
@@ -134,20 +175,18 @@ class ResendActivationCodeForm(UserCacheMixin, forms.Form):
     def clean_email_or_username(self):
         email_or_username = self.cleaned_data['email_or_username']
 
-        user = User.objects.filter(Q(username=email_or_username) | Q(email__iexact=email_or_username)).first()
+        user = _lookup_user_by_login(_users_with_activation_state(), email_or_username)
         if not user:
-            raise ValidationError(_('Bu eposta veya kullanıcı adı üzerine kayıtlı bir hesap bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL_OR_USERNAME)
 
         if user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
-        activation = user.activation_set.first()
-        if not activation:
-            raise ValidationError(_('Aktivasyon kodu bulunamadı.'))
+        if not user.has_activation:
+            raise ValidationError(ERR_NO_ACTIVATION)
 
-        now_with_shift = timezone.now() - timedelta(hours=24)
-        if activation.created_at > now_with_shift:
-            raise ValidationError(_('Aktivasyon kodunuz halihazırda gönderilmiştir. 24 saat içerisinde sadece bir adet kod talebinde bulunabilirsiniz.'))
+        if user.has_recent_activation:
+            raise ValidationError(ERR_ACTIVATION_ALREADY_SENT)
 
         self.user_cache = user
 
@@ -160,20 +199,18 @@ class ResendActivationCodeViaEmailForm(UserCacheMixin, forms.Form):
     def clean_email(self):
         email = self.cleaned_data['email']
 
-        user = User.objects.filter(email__iexact=email).first()
+        user = _lookup_user_by_email(_users_with_activation_state(), email)
         if not user:
-            raise ValidationError(_('Bu eposta üzerine kayıtlı bir kullanıcı bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL)
 
         if user.is_active:
-            raise ValidationError(_('Bu hesap halihazırda aktif hale getirilmiş.'))
+            raise ValidationError(ERR_ALREADY_ACTIVE)
 
-        activation = user.activation_set.first()
-        if not activation:
-            raise ValidationError(_('Aktivasyon kodu bulunamadı'))
+        if not user.has_activation:
+            raise ValidationError(ERR_NO_ACTIVATION)
 
-        now_with_shift = timezone.now() - timedelta(hours=24)
-        if activation.created_at > now_with_shift:
-            raise ValidationError(_('Aktivasyon kodunuz hali hazırda gönderilmiştir. 24 saat içerisinde sadece bir adet kod talebinde bulunabilirsiniz.'))
+        if user.has_recent_activation:
+            raise ValidationError(ERR_ACTIVATION_ALREADY_SENT)
 
         self.user_cache = user
 
@@ -186,12 +223,12 @@ class RestorePasswordForm(UserCacheMixin, forms.Form):
     def clean_email(self):
         email = self.cleaned_data['email']
 
-        user = User.objects.filter(email__iexact=email).first()
+        user = _lookup_user_by_email(User.objects.only(*RESTORE_PASSWORD_USER_FIELDS), email)
         if not user:
-            raise ValidationError(_('Bu eposta üzerine kayıtlı bir kullanıcı bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -204,12 +241,12 @@ class RestorePasswordViaEmailOrUsernameForm(UserCacheMixin, forms.Form):
     def clean_email_or_username(self):
         email_or_username = self.cleaned_data['email_or_username']
 
-        user = User.objects.filter(Q(username=email_or_username) | Q(email__iexact=email_or_username)).first()
+        user = _lookup_user_by_login(User.objects.only(*RESTORE_PASSWORD_USER_FIELDS), email_or_username)
         if not user:
-            raise ValidationError(_('Bu eposta veya kullanıcı adı üzerine kayıtlı bir hesap bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL_OR_USERNAME)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -241,12 +278,14 @@ class ChangeEmailForm(forms.Form):
     def clean_email(self):
         email = self.cleaned_data['email']
 
-        if email == self.user.email:
-            raise ValidationError(_('Lütfen başka bir eposta adresi giriniz.'))
+        # Emails are unique case-insensitively, so a change of case alone isn't a new address
+        if email.lower() == self.user.email.lower():
+            raise ValidationError(ERR_SAME_EMAIL)
 
-        user = User.objects.filter(Q(email__iexact=email) & ~Q(id=self.user.id)).exists()
+        users = User.objects.annotate(email_lower=Lower('email'))
+        user = users.filter(email_lower=Lower(Value(email))).exclude(pk=self.user.pk).exists()
         if user:
-            raise ValidationError(_('Bu eposta adresini kullanamazsınız.'))
+            raise ValidationError(ERR_EMAIL_TAKEN)
 
         return email
 
@@ -257,12 +296,12 @@ class RemindUsernameForm(UserCacheMixin, forms.Form):
     def clean_email(self):
         email = self.cleaned_data['email']
 
-        user = User.objects.filter(email__iexact=email).first()
+        user = _lookup_user_by_email(User.objects.only(*REMIND_USERNAME_USER_FIELDS), email)
         if not user:
-            raise ValidationError(_('Bu eposta üzerine kayıtlı bir kullanıcı bulunmamaktadır.'))
+            raise ValidationError(ERR_NO_USER_WITH_EMAIL)
 
         if not user.is_active:
-            raise ValidationError(_('Bu hesap henüz aktif değil.'))
+            raise ValidationError(ERR_INACTIVE)
 
         self.user_cache = user
 
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0009_alter_user_last_name_max_length'),
+        ('accounts', '0002_auto_20180616_1933'),
+    ]
+
+    operations = [
+        # The default index on auth_user.email is case-sensitive, so the case-insensitive
+        # email lookups made by the sign in, sign up and restore forms can't use it.
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_lower_email_idx ON auth_user (LOWER(email));',
+            'DROP INDEX auth_user_lower_email_idx;',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2 on 2026-10-15 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_auth_user_lower_email_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activation',
+            index=models.Index(fields=['user', '-created_at'], name='accounts_ac_user_id_d8f35a_idx'),
+        ),
+    ]
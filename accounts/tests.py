@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from .forms import ChangeEmailForm, SignInViaEmailForm
+
+
+class EmailLookupTests(TestCase):
+    def setUp(self):
+        # Stored as typed, like ChangeEmailView does, rather than through normalize_email()
+        self.user = User.objects.create_user('alice', '', 'pw-secret-123')
+        User.objects.filter(pk=self.user.pk).update(email='a@BÜCHER.de')
+        self.other = User.objects.create_user('bob', 'bob@example.com', 'pw-secret-123')
+
+    def test_sign_in_with_non_ascii_email(self):
+        form = SignInViaEmailForm({'email': 'a@BÜCHER.de', 'password': 'pw-secret-123'})
+
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.user_cache.pk, self.user.pk)
+
+    def test_sign_in_with_email_in_other_case(self):
+        form = SignInViaEmailForm({'email': 'A@BÜCHER.DE', 'password': 'pw-secret-123'})
+
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_change_email_to_taken_non_ascii_email(self):
+        form = ChangeEmailForm(self.other, {'email': 'a@BÜCHER.de'})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+
+class SignInTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw-secret-123')
+
+    def test_user_cache_is_reset_on_clean(self):
+        form = SignInViaEmailForm({'email': 'alice@example.com', 'password': 'pw-secret-123'})
+        self.assertTrue(form.is_valid())
+
+        form.data = {'email': 'nobody@example.com', 'password': 'pw-secret-123'}
+        form.full_clean()
+
+        self.assertIsNone(form.user_cache)
+        self.assertIn('email', form.errors)
+        self.assertNotIn('password', form.errors)
@@ -49,3 +49,9 @@ def send_forgotten_username_email(email, username):
     }
 
     send_mail(email, 'forgotten_username', context)
+
+
+def is_email_taken_error(error):
+    # Only a violation of the unique LOWER(email) index from migration 0005 means the email is taken.
+    # SQLite and PostgreSQL both name the index in the error message.
+    return 'auth_user_email_lower_uniq' in str(error)
@@ -2,6 +2,7 @@ from django.contrib import messages
 from django.contrib.auth import login, authenticate, REDIRECT_FIELD_NAME
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import IntegrityError, transaction
 from django.contrib.auth.views import (
     LogoutView as BaseLogoutView, PasswordChangeView as BasePasswordChangeView,
     PasswordResetDoneView as BasePasswordResetDoneView, PasswordResetConfirmView as BasePasswordResetConfirmView,
@@ -21,8 +22,10 @@ from django.conf import settings
 
 from .utils import (
     send_activation_email, send_reset_password_email, send_forgotten_username_email, send_activation_change_email,
+    is_email_taken_error,
 )
 from .forms import (
+    ERR_EMAIL_TAKEN,
     SignInViaUsernameForm, SignInViaEmailForm, SignInViaEmailOrUsernameForm, SignUpForm,
     RestorePasswordForm, RestorePasswordViaEmailOrUsernameForm, RemindUsernameForm,
     ResendActivationCodeForm, ResendActivationCodeViaEmailForm, ChangeProfileForm, ChangeEmailForm, ChangePasswordForm,
@@ -102,8 +105,16 @@ class SignUpView(GuestOnlyView, FormView):
         if settings.ENABLE_USER_ACTIVATION:
             user.is_active = False
 
-        # Create a user record
-        user.save()
+        # Create a user record, the email uniqueness is enforced by the database
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError as e:
+            if not is_email_taken_error(e):
+                raise
+
+            form.add_error('email', ERR_EMAIL_TAKEN)
+            return self.form_invalid(form)
 
         # Change the username to the "user_ID" form
         if settings.DISABLE_USERNAME:
@@ -164,8 +175,8 @@ class ResendActivationCodeView(GuestOnlyView, FormView):
     def form_valid(self, form):
         user = form.user_cache
 
-        activation = user.activation_set.first()
-        activation.delete()
+        # Drop the previous code, the form has already checked that one exists
+        user.activation_set.all().delete()
 
         code = get_random_string(20)
 
@@ -258,7 +269,19 @@ class ChangeEmailView(LoginRequiredMixin, FormView):
             messages.success(self.request, _('To complete the change of email address, click on the link sent to it.'))
         else:
             user.email = email
-            user.save()
+
+            try:
+                with transaction.atomic():
+                    user.save()
+            except IntegrityError as e:
+                if not is_email_taken_error(e):
+                    raise
+
+                # Don't leave the rejected address on request.user
+                user.refresh_from_db(fields=['email'])
+
+                form.add_error('email', ERR_EMAIL_TAKEN)
+                return self.form_invalid(form)
 
             messages.success(self.request, _('Email successfully changed.'))
 
@@ -270,10 +293,19 @@ class ChangeEmailActivateView(View):
     def get(request, code):
         act = get_object_or_404(Activation, code=code)
 
-        # Change the email
+        # Change the email, unless someone else has taken it since the code was sent
         user = act.user
         user.email = act.email
-        user.save()
+
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError as e:
+            if not is_email_taken_error(e):
+                raise
+
+            messages.error(request, ERR_EMAIL_TAKEN)
+            return redirect('accounts:change_email')
 
         # Remove the activation record
         act.delete()